@@ -1,10 +1,14 @@
 # app.py
+import logging
 import os
 from pathlib import Path
 import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
+
+logger = logging.getLogger(__name__)
 
 # ---------- Page config ----------
 st.set_page_config(
@@ -47,78 +51,312 @@ st.title("📊 Global Superstore — Interactive Dashboard")
 
 # ---------- Settings ----------
 DATA_PATH = Path("data/Global_Superstore.csv")
-EXPECTED_COLS = [
-    "Row ID","Order ID","Order Date","Ship Date","Ship Mode","Customer ID","Customer Name",
-    "Segment","Country","City","State","Postal Code","Region","Product ID","Category",
-    "Sub-Category","Product Name","Sales","Quantity","Discount","Profit"
+# Only the columns the dashboard reads; everything else is skipped at load time
+USED_COLS = [
+    "Order Date","Ship Date","Region","Category","Sub-Category",
+    "Sales","Profit","Quantity","Discount","Customer Name"
 ]
+# Column types for the CSV reader; dates stay strings and are parsed in normalize_types.
+# Numeric columns are left to inference so dirty cells ("$5", "1,234.50") are coerced
+# to NaN there rather than failing the whole read
+CSV_DTYPES = {
+    "Order Date": "string", "Ship Date": "string",
+}
+# CSVs above this size are parsed in chunks to keep peak memory near one chunk
+CSV_CHUNK_THRESHOLD = 200 * 1024**2
+CSV_CHUNK_ROWS = 500_000
+# Bar value labels are the slowest part of Plotly's layout; drop them on crowded charts
+MAX_BAR_LABELS = 20
+BAR_CONFIG = {"staticPlot": False, "responsive": False}
+# Per-filter-state caches are shared across sessions; cap them so memory stays bounded.
+# Aggregates are a few small frames each, CSV exports can be as large as the filtered data
+AGG_CACHE_ENTRIES = 64
+CSV_CACHE_ENTRIES = 4
 
 # ---------- Helpers ----------
+def is_binary_dtype(dtype) -> bool:
+    return isinstance(dtype, pd.ArrowDtype) and str(dtype).startswith(("binary", "large_binary"))
+
+
+def read_csv_fast(src, encoding: str) -> pd.DataFrame:
+    # Undecodable bytes (e.g. a latin-1 export uploaded as utf-8) become U+FFFD instead of failing the load
+    # pyarrow rejects callable/unknown usecols, so pick the used columns off the header first
+    header = pd.read_csv(src, nrows=0, encoding=encoding, encoding_errors="replace").columns
+    if hasattr(src, "seek"):
+        src.seek(0)
+    usecols = [c for c in header if c.strip() in USED_COLS]
+
+    size = src.size if hasattr(src, "size") else os.path.getsize(src)
+    if size > CSV_CHUNK_THRESHOLD:
+        chunks = pd.read_csv(src, encoding=encoding, encoding_errors="replace", usecols=usecols,
+                             dtype=CSV_DTYPES, chunksize=CSV_CHUNK_ROWS)
+        return pd.concat(chunks, ignore_index=True)
+
+    # Arrow's multithreaded reader when pyarrow is installed, pandas' C parser otherwise
+    try:
+        df = pd.read_csv(src, engine="pyarrow", dtype_backend="pyarrow", encoding=encoding,
+                         encoding_errors="replace", usecols=usecols, dtype=CSV_DTYPES)
+    except ImportError:
+        return pd.read_csv(src, encoding=encoding, encoding_errors="replace", usecols=usecols, dtype=CSV_DTYPES)
+    # pyarrow ignores encoding_errors and hands undecodable text columns back as binary;
+    # the C parser does apply the replacement, so re-read with it
+    if any(is_binary_dtype(t) for t in df.dtypes):
+        if hasattr(src, "seek"):
+            src.seek(0)
+        df = pd.read_csv(src, encoding=encoding, encoding_errors="replace", usecols=usecols, dtype=CSV_DTYPES)
+    return df
+
+
+DATE_FORMATS = ["%m/%d/%Y", "%d/%m/%Y", "%Y-%m-%d"]
+
+
+def smart_parse_datetime(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    # Rank the formats on a small sample, then parse the full column on the fixed-format path.
+    # A sample can tie (e.g. a day-first file sorted by date starts with days <= 12), so like the
+    # old dayfirst retry, a parse that fails on more than half the column falls through to the next format
+    sample = series.dropna().head(200)
+    scores = [pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum() for fmt in DATE_FORMATS]
+    best = None
+    for i in sorted(range(len(DATE_FORMATS)), key=lambda i: -scores[i]):
+        if scores[i] == 0:
+            break
+        parsed = pd.to_datetime(series, format=DATE_FORMATS[i], errors="coerce", cache=True)
+        if parsed.isna().mean() <= 0.5:
+            return parsed
+        if best is None or parsed.isna().sum() < best.isna().sum():
+            best = parsed
+    return best if best is not None else pd.to_datetime(series, errors="coerce")
+
+
+def normalize_types(df: pd.DataFrame) -> pd.DataFrame:
+    # Any text column still held as raw bytes is decoded so names never render as b'...'
+    for col in df.columns:
+        if is_binary_dtype(df[col].dtype):
+            df[col] = df[col].map(lambda b: b.decode("utf-8", errors="replace"), na_action="ignore").astype("string")
+
+    for col in ["Order Date", "Ship Date"]:
+        if col in df.columns:
+            df[col] = smart_parse_datetime(df[col])
+
+    for col in ["Sales", "Profit", "Discount", "Quantity"]:
+        if col in df.columns:
+            # NumPy float64 whatever the reader produced (Arrow doubles, strings, Int64)
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return df
+
+
+def read_excel_fast(src) -> pd.DataFrame:
+    usecols = lambda c: str(c).strip() in USED_COLS
+    # Rust-backed calamine streams the sheet when python-calamine is installed, openpyxl otherwise
+    try:
+        return pd.read_excel(src, engine="calamine", usecols=usecols)
+    except ImportError:
+        if hasattr(src, "seek"):
+            src.seek(0)
+        return pd.read_excel(src, engine="openpyxl", usecols=usecols)
+
+
 @st.cache_data(show_spinner=False)
 def load_data(file: Path | None, uploaded_file=None) -> pd.DataFrame:
+    cache = None
     if uploaded_file is not None:
         name = uploaded_file.name.lower()
         if name.endswith(".xlsx") or name.endswith(".xls"):
-            df = pd.read_excel(uploaded_file, engine="openpyxl")
+            df = read_excel_fast(uploaded_file)
         else:
-            df = pd.read_csv(uploaded_file, encoding="utf-8", errors="replace")
+            df = read_csv_fast(uploaded_file, encoding="utf-8")
     else:
         if not file.exists():
             raise FileNotFoundError(f"Dataset not found: {file}")
+        # Typed Parquet sidecar, rebuilt whenever the source file is newer or unreadable
+        cache = file.with_suffix(".parquet")
+        if cache.exists() and cache.stat().st_mtime >= file.stat().st_mtime:
+            try:
+                return pd.read_parquet(cache, engine="pyarrow", columns=USED_COLS)
+            except (ImportError, OSError, ValueError, KeyError) as exc:
+                # Truncated/corrupt file (ArrowInvalid is a ValueError) or missing columns:
+                # reparse the source below, which rewrites the sidecar
+                logger.warning("Ignoring unreadable Parquet sidecar %s: %s", cache, exc)
         if str(file).lower().endswith((".xlsx", ".xls")):
-            df = pd.read_excel(file, engine="openpyxl")
+            df = read_excel_fast(file)
         else:
-            df = pd.read_csv(file, encoding="latin-1")
+            df = read_csv_fast(file, encoding="latin-1")
 
 
     df.columns = [c.strip() for c in df.columns]
-    missing = [c for c in EXPECTED_COLS if c not in df.columns]
+    missing = [c for c in USED_COLS if c not in df.columns]
     if missing:
         st.warning(f"⚠️ Missing columns: {missing}")
+    df = normalize_types(df)
+
+    # Only complete datasets are cached, so the sidecar always has every USED_COLS column
+    if cache is not None and not missing:
+        # Write beside the target and swap it in, so an interrupted write never leaves a truncated sidecar
+        tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            df.to_parquet(tmp, engine="pyarrow", compression="snappy", index=False)
+            os.replace(tmp, cache)
+        except (ImportError, OSError, ValueError):
+            tmp.unlink(missing_ok=True)  # read-only checkout or no pyarrow: keep serving from the source file
     return df
 
 
-def smart_parse_datetime(series: pd.Series) -> pd.Series:
-    s1 = pd.to_datetime(series, errors="coerce", infer_datetime_format=True, dayfirst=False)
-    if s1.isna().mean() > 0.5:
-        s1 = pd.to_datetime(series, errors="coerce", infer_datetime_format=True, dayfirst=True)
-    return s1
-
-
-@st.cache_data(show_spinner=False)
+# cache_resource hands every rerun the same object instead of unpickling a copy.
+# The result is shared across sessions and must never be mutated; apply_filters
+# may return it as-is, and later steps only read from it.
+@st.cache_resource(show_spinner=False)
 def preprocess(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    # Mutates df in place: it is the fresh copy load_data's cache hands back, so no defensive copy
     for col in ["Order Date", "Ship Date"]:
-        if col in df.columns:
-            df[col] = smart_parse_datetime(df[col])
-        else:
+        if col not in df.columns:
             st.error(f"❌ Missing column '{col}'")
             st.stop()
 
-    for col in ["Sales", "Profit", "Discount", "Quantity"]:
+    df.dropna(subset=["Order Date", "Sales", "Profit"], inplace=True)
+    # Days since epoch as int32: groups far faster than per-row datetime.date objects
+    df["OrderDay"] = df["Order Date"].to_numpy().astype("datetime64[D]").astype("int32")
+    for col in ["Region", "Category", "Sub-Category", "Customer Name"]:
         if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    df = df.dropna(subset=["Order Date", "Sales", "Profit"])
-    df["Order Date (Date)"] = df["Order Date"].dt.date
+            df[col] = df[col].astype("category")
+
+    # Narrow the columns that only feed charts; Sales and Profit stay float64 because
+    # the KPI cards show them to the cent and float32 storage already loses that
+    if "Discount" in df.columns:
+        df["Discount"] = df["Discount"].astype("float32")
+    if "Quantity" in df.columns:
+        # Smallest int that holds every value; fractions or NaN keep it float, so nothing wraps or truncates
+        df["Quantity"] = pd.to_numeric(df["Quantity"], downcast="integer")
     return df
 
 
 def apply_filters(df: pd.DataFrame, region_sel, category_sel, subcat_sel) -> pd.DataFrame:
-    mask = pd.Series(True, index=df.index)
-    if region_sel:
-        mask &= df["Region"].isin(region_sel)
-    if category_sel:
-        mask &= df["Category"].isin(category_sel)
-    if subcat_sel:
-        mask &= df["Sub-Category"].isin(subcat_sel)
-    return df[mask]
+    # A selection covering every category (the sidebar default) filters nothing, so skip it
+    active = [
+        (col, sel) for col, sel in (("Region", region_sel), ("Category", category_sel), ("Sub-Category", subcat_sel))
+        if sel and len(sel) < len(df[col].cat.categories)
+    ]
+    if not active:
+        return df
+
+    # Match on the categorical codes so each test is an int scan instead of string compares
+    mask = np.ones(len(df), dtype=bool)
+    for col, sel in active:
+        codes = df[col].cat.codes.to_numpy()
+        sel_codes = df[col].cat.categories.get_indexer(list(sel))
+        np.logical_and(mask, np.isin(codes, sel_codes[sel_codes >= 0]), out=mask)
+    return df.iloc[np.flatnonzero(mask)]
+
+
+def code_sums(codes: np.ndarray, labels, key: str, values: dict[str, np.ndarray]) -> pd.DataFrame:
+    # Scatter-add each value column into its group slot with np.bincount (a single C loop,
+    # float64 accumulator); negative codes are missing keys, empty groups are dropped
+    valid = codes >= 0
+    if not valid.all():
+        codes = codes[valid]
+        values = {name: v[valid] for name, v in values.items()}
+    seen = np.bincount(codes, minlength=len(labels)) > 0
+    out = {key: np.asarray(labels)[seen]}
+    for name, v in values.items():
+        out[name] = np.bincount(codes, weights=v, minlength=len(labels))[seen]
+    return pd.DataFrame(out)
+
+
+def build_aggregates(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    # All chart aggregations in one place; the charts below only render these small frames.
+    # Every key is an int code (categoricals, OrderDay), so each sum is a bincount, not a hash groupby
+    sales = df["Sales"].to_numpy()
+    profit = df["Profit"].to_numpy()
+
+    def by_category(col: str, values: dict[str, np.ndarray]) -> pd.DataFrame:
+        return code_sums(df[col].cat.codes.to_numpy(), df[col].cat.categories, col, values)
+
+    # KPI totals ride along so cached_aggregates serves them for repeated selections too
+    aggs = {"totals": pd.DataFrame({"Sales": [sales.sum()], "Profit": [profit.sum()]})}
+    if "Region" in df.columns:
+        aggs["region"] = by_category("Region", {"Sales": sales}).sort_values("Sales", ascending=False)
+    if "Category" in df.columns:
+        aggs["category"] = by_category("Category", {"Profit": profit}).sort_values("Profit", ascending=False)
+
+    # Day offsets from the first order; slots come out in date order, as the area chart needs
+    days = df["OrderDay"].to_numpy()
+    lo = int(days.min()) if len(days) else 0
+    span = int(days.max()) - lo + 1 if len(days) else 0
+    day_labels = (np.arange(span) + lo).astype("datetime64[D]")
+    aggs["ts"] = code_sums(days - lo, day_labels, "Date", {"Sales": sales})
+
+    if "Customer Name" in df.columns:
+        # Partial top-k: argpartition picks the five largest in O(n), only those five get sorted
+        cust = by_category("Customer Name", {"Sales": sales})
+        vals = cust["Sales"].to_numpy()
+        k = min(5, len(vals))
+        idx = np.argpartition(-vals, k - 1)[:k] if k < len(vals) else np.arange(len(vals))
+        idx = idx[np.argsort(-vals[idx], kind="stable")]
+        aggs["top5"] = cust.iloc[idx].reset_index(drop=True)
+    if "Sub-Category" in df.columns:
+        subperf = by_category("Sub-Category", {"Sales": sales, "Profit": profit})
+        aggs["subperf"] = subperf.sort_values("Sales", ascending=False)
+    return aggs
+
+
+@st.cache_data(show_spinner=False, max_entries=AGG_CACHE_ENTRIES)
+def cached_aggregates(_df: pd.DataFrame, data_key, region_sel, category_sel, subcat_sel) -> dict[str, pd.DataFrame]:
+    # _df is not hashed; data_key identifies the dataset and the sorted selections the filter state
+    return build_aggregates(apply_filters(_df, region_sel, category_sel, subcat_sel))
+
+
+@st.cache_data(show_spinner=False, max_entries=CSV_CACHE_ENTRIES)
+def filtered_csv(_df: pd.DataFrame, filter_key) -> bytes:
+    # Keyed on the dataset + selections like cached_aggregates; internal columns like OrderDay stay out
+    return _df[[c for c in _df.columns if c in USED_COLS]].to_csv(index=False).encode("utf-8")
 
 
 def kpi_card(label, value, delta=None):
     st.metric(label, value, delta=delta)
 
 
+def bar_labels(g: pd.DataFrame):
+    return ".2s" if len(g) <= MAX_BAR_LABELS else False
+
+
+# Figure builders take the small aggregated frames, so hashing them for the cache is cheap
+@st.cache_data(show_spinner=False)
+def make_region_bar(g: pd.DataFrame) -> go.Figure:
+    fig = px.bar(g, x="Region", y="Sales", text_auto=bar_labels(g), color="Sales", color_continuous_scale="Blues")
+    fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
+    return fig
+
+
+@st.cache_data(show_spinner=False)
+def make_category_bar(g: pd.DataFrame) -> go.Figure:
+    fig = px.bar(g, x="Category", y="Profit", text_auto=bar_labels(g), color="Profit", color_continuous_scale="Viridis")
+    fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
+    return fig
+
+
+# Not cached: unpickling a cached Scattergl figure costs more than rebuilding it
+def make_sales_area(ts: pd.DataFrame) -> go.Figure:
+    # WebGL trace: one canvas draw instead of an SVG path per point
+    fig = go.Figure(go.Scattergl(x=ts["Date"], y=ts["Sales"], mode="lines", fill="tozeroy", line_color="#3b82f6"))
+    fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
+    return fig
+
+
+@st.cache_data(show_spinner=False)
+def make_top5_bar(top5: pd.DataFrame) -> go.Figure:
+    fig = px.bar(top5, x="Customer Name", y="Sales", text_auto=bar_labels(top5), color="Sales", color_continuous_scale="Plasma")
+    fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
+    return fig
+
+
+@st.cache_data(show_spinner=False)
+def make_subcat_bar(subperf: pd.DataFrame) -> go.Figure:
+    fig = px.bar(subperf, x="Sub-Category", y="Sales", color="Profit", text_auto=bar_labels(subperf), color_continuous_scale="RdYlGn")
+    fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
+    return fig
+
+
 # ---------- Data ----------
 st.sidebar.header("📁 Data")
 uploaded = st.sidebar.file_uploader("Upload CSV/XLSX", type=["csv", "xlsx", "xls"])
@@ -129,6 +367,7 @@ except FileNotFoundError:
     st.stop()
 
 df = preprocess(df_raw)
+data_key = uploaded.file_id if uploaded else DATA_PATH.stat().st_mtime_ns
 
 # ---------- Sidebar filters ----------
 st.sidebar.header("🔎 Filters")
@@ -141,10 +380,12 @@ cat_sel    = st.sidebar.multiselect("📦 Category", cats, default=cats)
 subcat_sel = st.sidebar.multiselect("🛒 Sub-Category", subcats, default=subcats)
 
 df_f = apply_filters(df, region_sel, cat_sel, subcat_sel)
+sel_key = (tuple(sorted(region_sel)), tuple(sorted(cat_sel)), tuple(sorted(subcat_sel)))
+aggs = cached_aggregates(df, data_key, *sel_key)
 
 # ---------- KPIs ----------
-total_sales  = float(df_f["Sales"].sum()) if "Sales" in df_f.columns else 0.0
-total_profit = float(df_f["Profit"].sum()) if "Profit" in df_f.columns else 0.0
+total_sales  = float(aggs["totals"]["Sales"].iat[0])
+total_profit = float(aggs["totals"]["Profit"].iat[0])
 margin = (total_profit / total_sales * 100) if total_sales != 0 else 0.0
 
 col1, col2, col3 = st.columns(3)
@@ -161,49 +402,49 @@ st.divider()
 c1, c2 = st.columns(2)
 with c1:
     st.subheader("🌍 Sales by Region")
-    if "Region" in df_f.columns:
-        g = df_f.groupby("Region", as_index=False)["Sales"].sum().sort_values("Sales", ascending=False)
-        fig = px.bar(g, x="Region", y="Sales", text_auto=".2s", color="Sales", color_continuous_scale="Blues")
-        fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
-        st.plotly_chart(fig, use_container_width=True)
+    if "region" in aggs:
+        st.plotly_chart(make_region_bar(aggs["region"]), use_container_width=True, config=BAR_CONFIG)
 
 with c2:
     st.subheader("📦 Profit by Category")
-    if "Category" in df_f.columns:
-        g = df_f.groupby("Category", as_index=False)["Profit"].sum().sort_values("Profit", ascending=False)
-        fig = px.bar(g, x="Category", y="Profit", text_auto=".2s", color="Profit", color_continuous_scale="Viridis")
-        fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
-        st.plotly_chart(fig, use_container_width=True)
+    if "category" in aggs:
+        st.plotly_chart(make_category_bar(aggs["category"]), use_container_width=True, config=BAR_CONFIG)
 
 c3, c4 = st.columns(2)
 with c3:
     st.subheader("📅 Sales Over Time")
-    ts = df_f.groupby("Order Date (Date)", as_index=False)["Sales"].sum().rename(columns={"Order Date (Date)": "Date"})
+    ts = aggs["ts"]
     if not ts.empty:
-        fig = px.area(ts, x="Date", y="Sales", color_discrete_sequence=["#3b82f6"])
-        fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(make_sales_area(ts), use_container_width=True)
 
 with c4:
     st.subheader("🏆 Top 5 Customers")
-    if "Customer Name" in df_f.columns:
-        top5 = df_f.groupby("Customer Name", as_index=False)["Sales"].sum().nlargest(5, "Sales")
-        fig = px.bar(top5, x="Customer Name", y="Sales", text_auto=".2s", color="Sales", color_continuous_scale="Plasma")
-        fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
-        st.plotly_chart(fig, use_container_width=True)
-        with st.expander("🔍 See table"):
-            st.dataframe(top5, use_container_width=True)
-
-st.subheader("🛒 Sub-Category Performance")
-if "Sub-Category" in df_f.columns:
-    subperf = df_f.groupby("Sub-Category", as_index=False).agg(Sales=("Sales","sum"), Profit=("Profit","sum"))
-    subperf = subperf.sort_values("Sales", ascending=False)
-    fig = px.bar(subperf, x="Sub-Category", y="Sales", color="Profit", text_auto=".2s", color_continuous_scale="RdYlGn")
-    fig.update_layout(yaxis_title=None, xaxis_title=None, plot_bgcolor="white")
-    st.plotly_chart(fig, use_container_width=True)
-    with st.expander("⬇ Download Data"):
-        csv = df_f.to_csv(index=False).encode("utf-8")
-        st.download_button("Download CSV", csv, "filtered_data.csv", "text/csv")
+    if "top5" in aggs:
+        st.plotly_chart(make_top5_bar(aggs["top5"]), use_container_width=True, config=BAR_CONFIG)
+
+# ---------- Detailed views ----------
+@st.fragment
+def detailed_views(df_f: pd.DataFrame, aggs: dict[str, pd.DataFrame], filter_key):
+    # Nothing below is built until the toggle is on, and flipping it reruns only this fragment
+    if not st.toggle("📊 Show detailed views", value=False):
+        return
+
+    if "top5" in aggs:
+        st.subheader("🏆 Top 5 Customers — Table")
+        st.dataframe(aggs["top5"], use_container_width=True)
+
+    st.subheader("🛒 Sub-Category Performance")
+    if "subperf" in aggs:
+        st.plotly_chart(make_subcat_bar(aggs["subperf"]), use_container_width=True, config=BAR_CONFIG)
+        with st.expander("⬇ Download Data"):
+            csv = filtered_csv(df_f, filter_key)
+            st.download_button("Download CSV", csv, "filtered_data.csv", "text/csv")
 
-with st.expander("📄 Raw Data Preview"):
-    st.dataframe(df_f.head(50), use_container_width=True)
+    with st.expander("📄 Raw Data Preview"):
+        # Small standalone copy of just the dashboard columns keeps the Arrow payload tiny
+        preview = df_f.head(50)[[c for c in USED_COLS if c in df_f.columns]].copy().convert_dtypes()
+        st.dataframe(preview, use_container_width=True, hide_index=True)
+
+
+st.divider()
+detailed_views(df_f, aggs, (data_key, *sel_key))